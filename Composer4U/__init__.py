@@ -14,10 +14,15 @@
 # limitations under the License.
 
 
-import bpy
 import os
 import sys
 
+try:
+    import bpy
+except ImportError:
+    # The package is also imported outside Blender by the ducking worker processes
+    bpy = None
+
 bl_info = {
     "name": "Composer4U",
     "author": "PRAVIN", # Your name here
@@ -38,25 +43,29 @@ if vendor_dir not in sys.path:
     print(f"Added '{vendor_dir}' to sys.path for Composer4U addon.")
 
 # Import modules
-from . import preferences
-from . import properties
-from . import operators
-from . import ui_panels
+if bpy is not None:
+    from . import preferences
+    from . import properties
+    from . import operators
+    from . import ui_panels
 
-# List of classes to register/unregister
-# IMPORTANT: UIList classes (like COMPOSER4U_UL_History) and their PropertyGroup
-# must be registered BEFORE any panels/operators that use them.
-classes = (
-    properties.COMPOSER4U_AudioHistoryItem,   
-    properties.COMPOSER4U_UL_History,         
-    preferences.Composer4UAddonPreferences,   
-    operators.COMPOSER4U_OT_SendPrompt,
-    operators.COMPOSER4U_OT_AddAudioToTimeline, 
-    operators.COMPOSER4U_OT_StopGeneration,
-    operators.COMPOSER4U_OT_OpenDialog,       
-    ui_panels.COMPOSER4U_PT_MainPanel_3DView,
-    ui_panels.COMPOSER4U_PT_MainPanel_VSE,
-)
+    # List of classes to register/unregister
+    # IMPORTANT: UIList classes (like COMPOSER4U_UL_History) and their PropertyGroup
+    # must be registered BEFORE any panels/operators that use them.
+    classes = (
+        properties.COMPOSER4U_AudioHistoryItem,   
+        properties.COMPOSER4U_UL_History,         
+        preferences.Composer4UAddonPreferences,   
+        operators.COMPOSER4U_OT_SendPrompt,
+        operators.COMPOSER4U_OT_AddAudioToTimeline, 
+        operators.COMPOSER4U_OT_ExtendTrack,
+        operators.COMPOSER4U_OT_AutoDuck,
+        operators.COMPOSER4U_OT_TranscodeTakes,
+        operators.COMPOSER4U_OT_StopGeneration,
+        operators.COMPOSER4U_OT_OpenDialog,       
+        ui_panels.COMPOSER4U_PT_MainPanel_3DView,
+        ui_panels.COMPOSER4U_PT_MainPanel_VSE,
+    )
 
 def register():
     # Register all classes first
@@ -71,6 +80,8 @@ def register():
 def unregister():
     # Stop the async loop thread when the add-on is unregistered
     operators._stop_async_loop_thread()
+    operators._shutdown_process_pool()
+    operators._shutdown_transcode_pool()
     print("Composer4U Addon Unregistered. Async loop thread stopped.")
     # Unregister scene properties in reverse order
     properties.unregister_scene_properties_only_props()
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+# Copyright 2025 Pravin Saravanan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# Dialogue-aware ducking DSP.
+# IMPORTANT: This module runs inside ProcessPoolExecutor workers, so it must never import bpy.
+# Everything here takes and returns plain Python/NumPy data.
+
+import os
+import math
+import struct
+import hashlib
+import wave
+import tempfile
+
+try:
+    import numpy as np
+except ImportError:
+    print("Composer4U Error: numpy not found. Auto-ducking will be disabled.")
+    np = None # Set to None if not available
+
+
+# --- Common Configuration ---
+ENVELOPE_HOP_SECONDS = 0.02 # Resolution of the RMS envelopes and gain curves
+BLOCK_FRAMES = 1 << 20 # Frames processed per block so feature-length files never load at once
+HASH_SAMPLE_BYTES = 1 << 20 # Bytes read from the start and end of a file for its cache key
+ENVELOPE_CACHE_MAX_BYTES = 256 << 20 # Least recently used envelopes are pruned beyond this size
+SILENCE_FLOOR = 1e-10
+ENVELOPE_CACHE_DIR = os.path.join(tempfile.gettempdir(), "composer4u_envelope_cache")
+
+
+# --- WAV access ---
+def _read_wav_layout(filepath):
+    """Returns (data_offset, frames, channels, framerate, dtype, sample_bytes) of a WAV file."""
+    with open(filepath, 'rb') as f:
+        header = f.read(12)
+        if len(header) < 12 or header[0:4] != b'RIFF' or header[8:12] != b'WAVE':
+            raise wave.Error(f"{os.path.basename(filepath)} is not a WAV file")
+        fmt = None
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                raise wave.Error(f"{os.path.basename(filepath)} has no audio data")
+            chunk_id = chunk_header[0:4]
+            chunk_size = struct.unpack('<I', chunk_header[4:8])[0]
+            if chunk_id == b'fmt ':
+                fmt = f.read(chunk_size)
+                f.seek(chunk_size % 2, os.SEEK_CUR)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise wave.Error(f"{os.path.basename(filepath)} has no format chunk")
+                data_offset = f.tell()
+                break
+            else:
+                f.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+        # Clamp to the real file size, streamed files may carry an unpatched data size
+        file_size = os.fstat(f.fileno()).st_size
+
+    audio_format, channels, framerate = struct.unpack('<HHI', fmt[0:8])
+    bits = struct.unpack('<H', fmt[14:16])[0]
+    if audio_format == 0xFFFE and len(fmt) >= 26: # WAVE_FORMAT_EXTENSIBLE, real format is in the sub-format GUID
+        audio_format = struct.unpack('<H', fmt[24:26])[0]
+    if audio_format == 1 and bits in (16, 24, 32):
+        dtype = {16: '<i2', 24: 'u1', 32: '<i4'}[bits]
+    elif audio_format == 3 and bits == 32:
+        dtype = '<f4'
+    else:
+        raise wave.Error(f"{os.path.basename(filepath)}: unsupported WAV encoding (format {audio_format}, {bits} bit)")
+    sample_bytes = bits // 8
+    data_size = min(chunk_size, file_size - data_offset)
+    frames = data_size // (sample_bytes * channels)
+    return data_offset, frames, channels, framerate, dtype, sample_bytes
+
+
+def _iter_wav_blocks(filepath, block_frames=BLOCK_FRAMES):
+    """Yields float32 blocks of shape (frames, channels) in [-1, 1] from a memory-mapped WAV file."""
+    data_offset, frames, channels, framerate, dtype, sample_bytes = _read_wav_layout(filepath)
+    if frames == 0:
+        return
+    if sample_bytes == 3:
+        samples = np.memmap(filepath, dtype='u1', mode='r', offset=data_offset, shape=(frames, channels, 3))
+    else:
+        samples = np.memmap(filepath, dtype=dtype, mode='r', offset=data_offset, shape=(frames, channels))
+    try:
+        for start in range(0, frames, block_frames):
+            block = samples[start:start + block_frames]
+            if sample_bytes == 3:
+                # Assemble little-endian 24-bit integers and sign-extend them
+                raw = block.astype(np.int32)
+                values = raw[..., 0] | (raw[..., 1] << 8) | (raw[..., 2] << 16)
+                values = np.where(values >= 1 << 23, values - (1 << 24), values)
+                yield values.astype(np.float32) / float(1 << 23)
+            elif dtype == '<f4':
+                yield np.asarray(block, dtype=np.float32)
+            else:
+                yield block.astype(np.float32) / float(1 << (sample_bytes * 8 - 1))
+    finally:
+        del samples
+
+
+def get_wav_framerate(filepath):
+    return _read_wav_layout(filepath)[3]
+
+
+# --- Envelope cache ---
+def file_hash(filepath, hop_seconds):
+    """Cache key of a file: its size and modification time plus the first and last HASH_SAMPLE_BYTES.
+
+    The modification time catches edits that keep the length and leave both ends untouched,
+    such as a re-conformed dialogue file with a replaced line in the middle.
+    """
+    digest = hashlib.sha1()
+    stat = os.stat(filepath)
+    size = stat.st_size
+    digest.update(f"{size}:{stat.st_mtime_ns}:{hop_seconds}".encode())
+    with open(filepath, 'rb') as f:
+        digest.update(f.read(HASH_SAMPLE_BYTES))
+        if size > HASH_SAMPLE_BYTES:
+            f.seek(max(HASH_SAMPLE_BYTES, size - HASH_SAMPLE_BYTES))
+            digest.update(f.read(HASH_SAMPLE_BYTES))
+    return digest.hexdigest()
+
+
+def compute_rms_envelope(filepath, hop_seconds, cache_dir):
+    """Returns (envelope, cache_hit) where envelope holds the linear RMS of every hop_seconds window.
+
+    Envelopes are cached in cache_dir as .npy files named by file_hash(), so an unchanged
+    dialogue file is only analysed once across ducking runs and Blender sessions.
+    """
+    cache_path = os.path.join(cache_dir, file_hash(filepath, hop_seconds) + ".npy")
+    if os.path.exists(cache_path):
+        try:
+            envelope = np.load(cache_path)
+            os.utime(cache_path) # Mark as recently used for pruning
+            return envelope, True
+        except (OSError, ValueError):
+            pass # Corrupt cache entry, recompute below
+
+    framerate = get_wav_framerate(filepath)
+    hop_frames = max(1, int(round(hop_seconds * framerate)))
+    # Whole hops per block keep windows from straddling block boundaries
+    block_frames = max(hop_frames, (BLOCK_FRAMES // hop_frames) * hop_frames)
+    parts = []
+    for block in _iter_wav_blocks(filepath, block_frames):
+        squares = np.mean(np.square(block, dtype=np.float32), axis=1)
+        windows = -(-len(squares) // hop_frames)
+        squares = np.pad(squares, (0, windows * hop_frames - len(squares)))
+        parts.append(np.sqrt(squares.reshape(windows, hop_frames).mean(axis=1)))
+    envelope = np.concatenate(parts).astype(np.float32) if parts else np.zeros(0, dtype=np.float32)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = cache_path + f".{os.getpid()}.tmp.npy"
+    np.save(tmp_path, envelope)
+    os.replace(tmp_path, cache_path) # Atomic so concurrent workers never read a half-written entry
+    prune_envelope_cache(cache_dir)
+    return envelope, False
+
+
+def prune_envelope_cache(cache_dir, max_bytes=ENVELOPE_CACHE_MAX_BYTES):
+    """Deletes the least recently used envelopes until the cache fits in max_bytes."""
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".npy") or ".tmp" in name:
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue # Removed by another worker
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+# --- Gain curve ---
+def _thin_curve(times, values, tolerance):
+    """Reduces a sampled curve to the points needed to reproduce it within tolerance by linear interpolation."""
+    n = len(times)
+    if n <= 2:
+        return times, values
+    # Drop the interior of flat runs first, which leaves only the ramps for the slower pass
+    changes = np.abs(np.diff(values)) > tolerance * 1e-3
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    keep[1:] |= changes
+    keep[:-1] |= changes
+    idx = np.flatnonzero(keep)
+
+    # Ramer-Douglas-Peucker on the remaining points
+    t = times[idx]
+    v = values[idx]
+    selected = np.zeros(len(idx), dtype=bool)
+    selected[0] = selected[-1] = True
+    stack = [(0, len(idx) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        span_t = t[first + 1:last]
+        interp = v[first] + (v[last] - v[first]) * (span_t - t[first]) / (t[last] - t[first])
+        error = np.abs(v[first + 1:last] - interp)
+        worst = int(np.argmax(error))
+        if error[worst] > tolerance:
+            split = first + 1 + worst
+            selected[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return t[selected], v[selected]
+
+
+def build_gain_curve(sources, start_seconds, end_seconds, hop_seconds, threshold_db, duck_db,
+                     attack_seconds, release_seconds, tolerance_db=0.5):
+    """Derives a ducking gain curve over the timeline range [start_seconds, end_seconds).
+
+    sources is a list of (envelope, offset_seconds, visible_start_seconds, visible_end_seconds, volume)
+    where offset_seconds is the timeline time of the source's first sample. Returns
+    (times, gains_db) as thinned NumPy arrays in timeline seconds.
+    """
+    count = max(2, int(math.ceil((end_seconds - start_seconds) / hop_seconds)) + 1)
+    times = start_seconds + np.arange(count) * hop_seconds
+    level = np.zeros(count, dtype=np.float32)
+    for envelope, offset_seconds, visible_start, visible_end, volume in sources:
+        index = np.floor((times - offset_seconds) / hop_seconds).astype(np.int64)
+        valid = (times >= visible_start) & (times < visible_end) & (index >= 0) & (index < len(envelope))
+        level[valid] = np.maximum(level[valid], envelope[index[valid]] * volume)
+
+    level_db = 20.0 * np.log10(np.maximum(level, SILENCE_FLOOR))
+    target_db = np.where(level_db > threshold_db, duck_db, 0.0)
+
+    # One-pole smoothing, attack while the gain falls and release while it recovers
+    attack = math.exp(-hop_seconds / attack_seconds) if attack_seconds > 0 else 0.0
+    release = math.exp(-hop_seconds / release_seconds) if release_seconds > 0 else 0.0
+    gains_db = np.empty(count, dtype=np.float64)
+    gain = 0.0
+    for i, target in enumerate(target_db.tolist()):
+        coeff = attack if target < gain else release
+        gain = target + (gain - target) * coeff
+        gains_db[i] = gain
+
+    return _thin_curve(times, gains_db, tolerance_db)
+
+
+# --- Pre-mixed render ---
+def render_ducked_wav(music_path, output_path, offset_seconds, times, gains_db):
+    """Writes a 16-bit copy of music_path with the gain curve applied.
+
+    offset_seconds is the timeline time of the music file's first sample. The file is written
+    next to output_path first and moved into place only once complete.
+    """
+    _, _, channels, framerate, _, _ = _read_wav_layout(music_path)
+    tmp_path = output_path + ".tmp"
+    position = 0
+    with wave.open(tmp_path, 'wb') as writer:
+        writer.setnchannels(channels)
+        writer.setsampwidth(2)
+        writer.setframerate(framerate)
+        for block in _iter_wav_blocks(music_path):
+            sample_times = offset_seconds + (position + np.arange(len(block))) / framerate
+            gain = np.power(10.0, np.interp(sample_times, times, gains_db) / 20.0).astype(np.float32)
+            mixed = np.clip(block * gain[:, None], -1.0, 32767.0 / 32768.0)
+            writer.writeframes((mixed * 32768.0).astype('<i2').tobytes())
+            position += len(block)
+    os.replace(tmp_path, output_path)
+    return output_path
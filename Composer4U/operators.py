@@ -25,10 +25,23 @@ import time
 import datetime # For generating unique filenames
 import traceback # Added for detailed error reporting
 import concurrent.futures # Import for concurrent.futures.CancelledError
+import struct # For patching WAV headers in place
+import array
+import math
+import collections
+import multiprocessing
 
 # Import classes defined in properties.py and preferences.py
 from . import properties
 from . import preferences
+from . import ducking
+
+# --- AUD IMPORT (Blender's bundled audio library, used for transcoding) ---
+try:
+    import aud
+except ImportError:
+    print("Composer4U Error: aud module not found. Transcoding of finished takes will be disabled.")
+    aud = None # Set to None if not available
 
 # --- PYAUDIO IMPORT ---
 try:
@@ -54,6 +67,9 @@ OUTPUT_RATE = 48000
 MODEL = 'models/lyria-realtime-exp'
 CHUNK_SIZE_PYAUDIO = 4200 # This chunk size is for pyaudio internal buffer, not necessarily for API chunks
 VSE_channel = 1 # Default VSE channel for audio strips
+EXTEND_CROSSFADE_SECONDS = 0.05 # Length of the equal-power crossfade at the seam of an extended track
+SILENCE_TRIM_PADDING_SECONDS = 0.25 # Silence kept after the last audible block when trimming a take
+SINK_FLUSH_TIMEOUT_SECONDS = 10.0 # A final flush with no completed write for this long is treated as a hung sink
 
 # --- Global asyncio loop and task management ---
 _async_thread = None
@@ -101,6 +117,578 @@ def _submit_async_task_to_background(coro):
     return future
 
 
+# --- Process pool for CPU-heavy audio analysis ---
+_process_pool = None
+
+
+def _get_process_pool():
+    global _process_pool
+    if _process_pool is None:
+        # 'spawn' starts clean interpreters instead of forking Blender; workers only import the bpy-free ducking module
+        workers = max(1, min(4, (os.cpu_count() or 2) - 1))
+        _process_pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    return _process_pool
+
+
+def _shutdown_process_pool():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+# --- Background transcoding of finished takes ---
+# aud lives inside the Blender process, so transcoding uses threads rather than the process pool.
+_transcode_pool = None
+_transcode_jobs = {} # WAV path -> future
+_archived_wavs = set() # Relinked WAVs, removed once a save has written the relink to disk
+
+
+def _transcode_take(wav_path, transcode_format, bitrate_kbps):
+    # Runs in a worker thread; writes the encoded file next to the WAV and verifies it before returning
+    if transcode_format == 'FLAC':
+        extension, container, codec = ".flac", aud.CONTAINER_FLAC, aud.CODEC_FLAC
+    else:
+        extension, container, codec = ".ogg", aud.CONTAINER_OGG, aud.CODEC_OPUS
+    output_path = os.path.splitext(wav_path)[0] + extension
+    tmp_path = os.path.splitext(wav_path)[0] + ".partial" + extension
+    with wave.open(wav_path, 'rb') as wf:
+        expected_seconds = wf.getnframes() / wf.getframerate()
+    try:
+        aud.Sound(wav_path).write(tmp_path, rate=OUTPUT_RATE, channels=aud.CHANNELS_STEREO, format=aud.FORMAT_S16,
+                                  container=container, codec=codec, bitrate=bitrate_kbps * 1000)
+        # Verify by decoding: the length must match the source within one Opus frame of padding
+        check = aud.Sound(tmp_path)
+        actual_seconds = check.length / check.specs[0]
+        if os.path.getsize(tmp_path) == 0 or abs(actual_seconds - expected_seconds) > 0.1:
+            raise RuntimeError(f"verification failed ({actual_seconds:.2f}s decoded, {expected_seconds:.2f}s expected)")
+        os.replace(tmp_path, output_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return output_path, os.path.getsize(wav_path) - os.path.getsize(output_path)
+
+
+def _queue_transcode(wav_path, addon_prefs):
+    global _transcode_pool
+    if aud is None or addon_prefs.transcode_format == 'NONE':
+        return False
+    if not wav_path.lower().endswith(".wav") or not os.path.exists(wav_path) or wav_path in _transcode_jobs:
+        return False
+    if wav_path in _archived_wavs:
+        return False # Already archived, only waiting for a save to remove it
+    if _transcode_pool is None:
+        _transcode_pool = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="Composer4UTranscode")
+    _transcode_jobs[wav_path] = _transcode_pool.submit(_transcode_take, wav_path, addon_prefs.transcode_format,
+                                                       addon_prefs.opus_bitrate_kbps)
+    print(f"DEBUG: Transcode - Queued {wav_path} as {addon_prefs.transcode_format}.")
+    if not bpy.app.timers.is_registered(_poll_transcode_jobs):
+        # Persistent so loading another .blend does not leave the jobs unpolled
+        bpy.app.timers.register(_poll_transcode_jobs, first_interval=1.0, persistent=True)
+    return True
+
+
+def _poll_transcode_jobs():
+    # bpy.app timer on the main thread: relinks finished takes; their WAVs are removed after the next save
+    for wav_path, future in list(_transcode_jobs.items()):
+        if not future.done():
+            continue
+        del _transcode_jobs[wav_path]
+        try:
+            output_path, bytes_saved = future.result()
+        except Exception as e:
+            print(f"ERROR: Transcode - Failed to transcode {wav_path}, keeping the WAV: {e}")
+            _add_history_to_scenes_using(wav_path, f"Composer4U: Transcoding {os.path.basename(wav_path)} failed: {e}")
+            continue
+        if _is_active_take(wav_path):
+            # The take became active again (e.g. it is being extended), keep working from the WAV
+            os.remove(output_path)
+            continue
+
+        # Relink every reference in one main-thread step
+        target = os.path.normpath(wav_path)
+        relinked = 0
+        for sound in bpy.data.sounds:
+            if os.path.normpath(bpy.path.abspath(sound.filepath)) == target:
+                sound.filepath = output_path
+                relinked += 1
+        for scene in bpy.data.scenes:
+            if not scene.sequence_editor:
+                continue
+            for strip in scene.sequence_editor.sequences_all:
+                # Ducked strips remember the original music they were rendered from
+                source_path = strip.get("composer4u_source_path")
+                if source_path and os.path.normpath(bpy.path.abspath(source_path)) == target:
+                    strip["composer4u_source_path"] = output_path
+                    relinked += 1
+        scenes = _add_history_to_scenes_using(
+            wav_path, f"Composer4U: Archived {os.path.basename(wav_path)} as {os.path.basename(output_path)}, "
+                      f"saved {bytes_saved / (1024 * 1024):.1f} MB", output_path)
+        if not relinked and not scenes:
+            # The take belongs to a .blend that is no longer open; it still points at the WAV
+            os.remove(output_path)
+            print(f"DEBUG: Transcode - Nothing in this file uses {wav_path}, keeping the WAV.")
+            continue
+        if scenes:
+            scenes[0].composer4u_transcode_saved_mb += bytes_saved / (1024 * 1024)
+        # The relink only exists in memory until the file is saved, so the WAV has to outlive it
+        _archived_wavs.add(wav_path)
+        if _remove_archived_wavs not in bpy.app.handlers.save_post:
+            bpy.app.handlers.save_post.append(_remove_archived_wavs)
+        if _forget_archived_wavs not in bpy.app.handlers.load_pre:
+            bpy.app.handlers.load_pre.append(_forget_archived_wavs)
+        print(f"DEBUG: Transcode - Relinked {wav_path} -> {output_path}, saved {bytes_saved} bytes once saved.")
+    return 1.0 if _transcode_jobs else None # Returning None unregisters the timer
+
+
+def _wav_still_referenced(wav_path):
+    # True if anything in the open file still points at wav_path, e.g. after undoing past the relink
+    target = os.path.normpath(wav_path)
+    if any(os.path.normpath(bpy.path.abspath(sound.filepath)) == target for sound in bpy.data.sounds):
+        return True
+    if any(strip.get("composer4u_source_path") and
+           os.path.normpath(bpy.path.abspath(strip["composer4u_source_path"])) == target
+           for scene in bpy.data.scenes if scene.sequence_editor for strip in scene.sequence_editor.sequences_all):
+        return True
+    return any(item.audio_path and os.path.normpath(bpy.path.abspath(item.audio_path)) == target
+               for scene in bpy.data.scenes for item in scene.composer4u_history)
+
+
+@bpy.app.handlers.persistent
+def _remove_archived_wavs(*args):
+    # save_post handler: the saved .blend now references the archives, so the WAVs can go
+    for wav_path in list(_archived_wavs):
+        if _wav_still_referenced(wav_path):
+            continue # Keep it pending; a later save may carry the relink again
+        _archived_wavs.discard(wav_path)
+        try:
+            os.remove(wav_path)
+            print(f"DEBUG: Transcode - Removed archived {wav_path} after save.")
+        except OSError as e:
+            print(f"WARNING: Transcode - Could not remove {wav_path}: {e}")
+
+
+@bpy.app.handlers.persistent
+def _forget_archived_wavs(*args):
+    # load_pre handler: the relinks of the file being closed were not saved, so its WAVs stay on disk
+    if _archived_wavs:
+        print(f"DEBUG: Transcode - Keeping {len(_archived_wavs)} WAV(s) whose relink was not saved.")
+    _archived_wavs.clear()
+
+
+def _is_active_take(wav_path):
+    target = os.path.normpath(wav_path)
+    extend_container = COMPOSER4U_OT_ExtendTrack._result_container
+    if _is_task_running(COMPOSER4U_OT_ExtendTrack._async_task_future, extend_container) and \
+            os.path.normpath(extend_container.get('audio_filepath') or "") == target:
+        return True
+    return any(scene.composer4u_last_audio_path and
+               os.path.normpath(bpy.path.abspath(scene.composer4u_last_audio_path)) == target
+               for scene in bpy.data.scenes)
+
+
+def _add_history_to_scenes_using(wav_path, text, new_path=None):
+    # Adds text to the history of every scene that produced wav_path, repointing its entries to new_path
+    scenes = []
+    target = os.path.normpath(wav_path)
+    for scene in bpy.data.scenes:
+        matches = [item for item in scene.composer4u_history
+                   if item.audio_path and os.path.normpath(bpy.path.abspath(item.audio_path)) == target]
+        if not matches:
+            continue
+        if new_path:
+            for item in matches:
+                item.audio_path = new_path
+        scene.composer4u_history.add().text = text
+        scenes.append(scene)
+    return scenes
+
+
+def _discard_unlinked_transcode(future):
+    # Done callback for jobs abandoned at shutdown: nothing was relinked, so the WAV stays and the archive goes
+    if future.cancelled() or future.exception() is not None:
+        return
+    output_path = future.result()[0]
+    try:
+        os.remove(output_path)
+        print(f"DEBUG: Transcode - Removed unlinked {output_path} after shutdown.")
+    except OSError as e:
+        print(f"WARNING: Transcode - Could not remove unlinked {output_path}: {e}")
+
+
+def _shutdown_transcode_pool():
+    global _transcode_pool
+    if bpy.app.timers.is_registered(_poll_transcode_jobs):
+        bpy.app.timers.unregister(_poll_transcode_jobs)
+    for future in _transcode_jobs.values():
+        # Queued jobs are cancelled; running or unpolled ones clean up their output once they finish
+        if not future.cancel():
+            future.add_done_callback(_discard_unlinked_transcode)
+    _transcode_jobs.clear()
+    # Unsaved relinks keep their WAVs
+    _archived_wavs.clear()
+    for handlers, handler in ((bpy.app.handlers.save_post, _remove_archived_wavs),
+                              (bpy.app.handlers.load_pre, _forget_archived_wavs)):
+        if handler in handlers:
+            handlers.remove(handler)
+    if _transcode_pool is not None:
+        _transcode_pool.shutdown(wait=False, cancel_futures=True)
+        _transcode_pool = None
+
+
+def _is_task_running(future, result_container):
+    # A cancelled future reports done() at once, but its task keeps flushing buffered audio until finalized
+    if future is None:
+        return False
+    if not future.done():
+        return True
+    return future.cancelled() and bool(result_container.get('started')) and not result_container.get('finalized')
+
+
+def _get_running_generation_future():
+    # Returns the future of whichever generation task (new composition or extension) is still running
+    for op in (COMPOSER4U_OT_SendPrompt, COMPOSER4U_OT_ExtendTrack):
+        if _is_task_running(op._async_task_future, op._result_container):
+            return op._async_task_future
+    return None
+
+
+# --- In-place WAV editing ---
+def _locate_wav_data_chunk(f):
+    # Returns (data_offset, data_size) of a Composer4U WAV whose data chunk is the last chunk in the file
+    f.seek(0)
+    header = f.read(12)
+    if len(header) < 12 or header[0:4] != b'RIFF' or header[8:12] != b'WAVE':
+        raise wave.Error("not a RIFF/WAVE file")
+    file_size = os.fstat(f.fileno()).st_size
+    fmt_ok = False
+    while True:
+        chunk_header = f.read(8)
+        if len(chunk_header) < 8:
+            raise wave.Error("data chunk not found")
+        chunk_id = chunk_header[0:4]
+        chunk_size = struct.unpack('<I', chunk_header[4:8])[0]
+        if chunk_id == b'fmt ':
+            fmt = f.read(chunk_size)
+            audio_format, nchannels, framerate = struct.unpack('<HHI', fmt[0:8])
+            sampwidth_bits = struct.unpack('<H', fmt[14:16])[0]
+            fmt_ok = (audio_format == 1 and nchannels == CHANNELS and
+                      framerate == OUTPUT_RATE and sampwidth_bits == FORMAT_WAV_BITS)
+            f.seek(chunk_size % 2, os.SEEK_CUR)
+        elif chunk_id == b'data':
+            if not fmt_ok:
+                raise wave.Error("audio format does not match Composer4U output (16-bit PCM, 48 kHz stereo)")
+            data_offset = f.tell()
+            # In-place edits are only possible when the audio data is the last chunk in the file
+            if data_offset + chunk_size != file_size:
+                raise wave.Error("data chunk is not at the end of the file, cannot edit in place")
+            return data_offset, chunk_size
+        else:
+            f.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+
+def _patch_wav_sizes(f, data_offset, data_size):
+    f.seek(4)
+    f.write(struct.pack('<I', data_offset - 8 + data_size))
+    f.seek(data_offset - 4)
+    f.write(struct.pack('<I', data_size))
+
+
+def _truncate_wav(filepath, frames):
+    # Cuts a WAV down to its first `frames` frames without rewriting the audio
+    frame_bytes = CHANNELS * (FORMAT_WAV_BITS // 8)
+    with open(filepath, 'r+b') as f:
+        data_offset, data_size = _locate_wav_data_chunk(f)
+        new_size = min(data_size, frames * frame_bytes)
+        f.truncate(data_offset + new_size)
+        _patch_wav_sizes(f, data_offset, new_size)
+    return (data_size - new_size) // frame_bytes
+
+
+class _WavAppender:
+    """Appends PCM audio to the end of an existing WAV file without rewriting it.
+
+    The RIFF and data chunk sizes are patched after every append so the file stays
+    valid even if the extension is interrupted. The first EXTEND_CROSSFADE_SECONDS of
+    new audio are blended into the existing tail with an equal-power crossfade.
+    """
+
+    def __init__(self, filepath, crossfade_seconds=EXTEND_CROSSFADE_SECONDS):
+        self.filepath = filepath
+        self.frame_bytes = CHANNELS * (FORMAT_WAV_BITS // 8)
+        self.frames_appended = 0
+        self._file = open(filepath, 'r+b')
+        try:
+            self._data_offset, self._data_size = _locate_wav_data_chunk(self._file)
+        except Exception:
+            self._file.close()
+            raise
+        # Crossfade cannot be longer than the audio that already exists
+        existing_frames = self._data_size // self.frame_bytes
+        self.fade_frames = min(int(crossfade_seconds * OUTPUT_RATE), existing_frames)
+        self._pending = bytearray() # New audio held back until the crossfade can be applied
+        self._partial_frame = b"" # Bytes of a frame split across chunks, written with the next append
+
+    def _patch_header(self):
+        _patch_wav_sizes(self._file, self._data_offset, self._data_size)
+
+    def _write_at_end(self, data):
+        self._file.seek(self._data_offset + self._data_size)
+        self._file.write(data)
+        self._data_size += len(data)
+        self.frames_appended += len(data) // self.frame_bytes
+
+    def _apply_crossfade(self):
+        fade_bytes = self.fade_frames * self.frame_bytes
+        tail_offset = self._data_offset + self._data_size - fade_bytes
+        self._file.seek(tail_offset)
+        old = array.array('h', self._file.read(fade_bytes))
+        new = array.array('h', bytes(self._pending[:fade_bytes]))
+        if sys.byteorder == 'big':
+            old.byteswap()
+            new.byteswap()
+        for frame in range(self.fade_frames):
+            t = (frame + 0.5) / self.fade_frames
+            gain_out = math.cos(t * math.pi / 2)
+            gain_in = math.sin(t * math.pi / 2)
+            for ch in range(CHANNELS):
+                i = frame * CHANNELS + ch
+                old[i] = max(-32768, min(32767, int(round(old[i] * gain_out + new[i] * gain_in))))
+        if sys.byteorder == 'big':
+            old.byteswap()
+        self._file.seek(tail_offset)
+        self._file.write(old.tobytes())
+        remainder = bytes(self._pending[fade_bytes:])
+        # The blended frames replace the existing tail, only what follows the seam adds length
+        self._pending = None
+        return remainder
+
+    def append(self, data):
+        if self._pending is not None:
+            self._pending.extend(data)
+            if len(self._pending) < self.fade_frames * self.frame_bytes:
+                return
+            data = self._apply_crossfade()
+        # Write whole frames only and carry a split frame over to the next chunk to keep samples aligned
+        data = self._partial_frame + bytes(data)
+        split = len(data) - len(data) % self.frame_bytes
+        data, self._partial_frame = data[:split], data[split:]
+        if data:
+            self._write_at_end(data)
+            self._patch_header()
+
+    def close(self):
+        if self._file.closed:
+            return
+        try:
+            if self._pending:
+                # Not enough new audio arrived for a full crossfade, append what we have as-is
+                pending, self._pending = bytes(self._pending), None
+                self.append(pending)
+            self._file.flush()
+        finally:
+            self._file.close()
+
+
+# --- Flow control between the receive loop and the audio sinks ---
+def _get_buffer_watermarks(addon_prefs):
+    # Returns (high, low) watermarks in bytes from the memory budget set in the add-on preferences
+    high = int(addon_prefs.buffer_high_watermark_mb * 1024 * 1024)
+    low = min(int(addon_prefs.buffer_low_watermark_mb * 1024 * 1024), high)
+    return high, low
+
+
+def _format_flow_stats(result_container):
+    # Short summary of the backpressure metrics for the history entry, empty if the stream never paused
+    pause_count = result_container.get('pause_count', 0)
+    if not pause_count:
+        return ""
+    return (f" (stream paused {pause_count}x for {result_container.get('paused_seconds', 0.0):.1f}s, "
+            f"peak buffer {result_container.get('peak_buffer_bytes', 0) / (1024 * 1024):.1f} MB)")
+
+
+class _SilenceDetector:
+    """Classifies received audio blocks as silent by their RMS and peak level.
+
+    Tracks the run of consecutive silent audio so the session can be ended after
+    max_silence_seconds, and the frame position after the last audible block so
+    trailing silence can be trimmed from the finished file.
+    """
+
+    def __init__(self, rms_threshold_db, peak_threshold_db, max_silence_seconds):
+        full_scale = float(1 << (FORMAT_WAV_BITS - 1))
+        self.rms_threshold = full_scale * 10.0 ** (rms_threshold_db / 20.0)
+        self.peak_threshold = full_scale * 10.0 ** (peak_threshold_db / 20.0)
+        self.max_silence_frames = int(max_silence_seconds * OUTPUT_RATE) # 0 disables the auto-stop
+        self.frames_seen = 0
+        self.silent_frames = 0
+        self.last_sound_frame = 0
+
+    def feed(self, chunk):
+        # Returns True once the silence limit has been reached. Runs on the event loop, so it has to stay cheap.
+        sample_count = len(chunk) // 2
+        if not sample_count:
+            return False
+        if ducking.np is not None:
+            samples = ducking.np.frombuffer(chunk, dtype='<i2', count=sample_count).astype(ducking.np.float64)
+            peak = float(ducking.np.abs(samples).max())
+            rms = math.sqrt(float(ducking.np.dot(samples, samples)) / sample_count)
+        else:
+            # Pure Python fallback, roughly 50x slower
+            samples = array.array('h', chunk[:sample_count * 2])
+            if sys.byteorder == 'big':
+                samples.byteswap()
+            peak = max(max(samples), -min(samples))
+            rms = math.sqrt(sum(x * x for x in samples) / sample_count)
+        frames = sample_count // CHANNELS
+        self.frames_seen += frames
+        if rms < self.rms_threshold and peak < self.peak_threshold:
+            self.silent_frames += frames
+        else:
+            self.silent_frames = 0
+            self.last_sound_frame = self.frames_seen
+        return self.max_silence_frames > 0 and self.silent_frames >= self.max_silence_frames
+
+
+class _FlowControlledChunkBuffer:
+    """Buffers received audio chunks until the sinks (WAV file, playback) have consumed them.
+
+    The receive loop only enqueues. When the buffered size reaches the high watermark the
+    server stream is paused with session.pause(), and it is resumed with session.play()
+    once the sinks have drained the buffer below the low watermark.
+    """
+
+    def __init__(self, session, high_watermark_bytes, low_watermark_bytes):
+        self._session = session
+        self.high_watermark_bytes = high_watermark_bytes
+        self.low_watermark_bytes = low_watermark_bytes
+        self._chunks = collections.deque()
+        self._available = asyncio.Event()
+        self._closed = False
+        self._pause_started = None
+        self.last_progress = time.monotonic() # When a sink last finished a write
+        self.buffered_bytes = 0
+        self.peak_buffered_bytes = 0
+        self.paused = False
+        self.pause_count = 0
+        self.paused_seconds = 0.0
+        self.sink_error = None
+
+    async def put(self, chunk):
+        # A failed sink would never drain the buffer, so stop receiving instead of pausing forever
+        if self.sink_error:
+            raise self.sink_error
+        self._chunks.append(chunk)
+        self.buffered_bytes += len(chunk)
+        self.peak_buffered_bytes = max(self.peak_buffered_bytes, self.buffered_bytes)
+        self._available.set()
+        if not self.paused and self.buffered_bytes >= self.high_watermark_bytes:
+            self.paused = True
+            self.pause_count += 1
+            self._pause_started = time.monotonic()
+            print(f"DEBUG: FlowControl - Buffer at {self.buffered_bytes} bytes, pausing stream.")
+            await self._session.pause()
+
+    def close(self):
+        # No more chunks will arrive; drain() returns once the remaining ones are written
+        self._closed = True
+        self._available.set()
+
+    def _end_pause(self):
+        self.paused = False
+        self.paused_seconds += time.monotonic() - self._pause_started
+        self._pause_started = None
+
+    async def drain(self, write_chunk):
+        # Runs as its own task; the blocking sink writes happen in the default executor
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._chunks:
+                if self._closed:
+                    break
+                self._available.clear()
+                await self._available.wait()
+                continue
+            chunk = self._chunks.popleft()
+            try:
+                await loop.run_in_executor(None, write_chunk, chunk)
+            except Exception as e:
+                self.sink_error = e
+                if self.paused:
+                    self._end_pause() # Nothing will drain the buffer any more, so it is no longer waiting to resume
+                raise
+            self.last_progress = time.monotonic()
+            self.buffered_bytes -= len(chunk)
+            if self.paused and self.buffered_bytes <= self.low_watermark_bytes:
+                self._end_pause()
+                if not self._closed:
+                    print(f"DEBUG: FlowControl - Buffer drained to {self.buffered_bytes} bytes, resuming stream.")
+                    await self._session.play()
+        if self.paused:
+            self._end_pause()
+
+    async def finish(self, consumer, abort_sinks=None, timeout=SINK_FLUSH_TIMEOUT_SECONDS):
+        """Closes the buffer and waits for the drain task while the sinks keep completing writes.
+
+        If no write completes for timeout seconds, abort_sinks is called to unblock the hung write
+        and the sinks get one more timeout. After that the drain task is abandoned, so a dead
+        device can never keep the generation from finalizing. Returns False if it was abandoned.
+        """
+        self.close()
+        aborted = False
+        while True:
+            remaining = self.last_progress + timeout - time.monotonic()
+            done, _ = await asyncio.wait({consumer}, timeout=max(remaining, 0))
+            if done:
+                consumer.result() # Re-raises a sink error
+                return True
+            if time.monotonic() - self.last_progress < timeout:
+                continue
+            if aborted or abort_sinks is None:
+                print(f"WARNING: FlowControl - Sinks hung, abandoning {len(self._chunks)} buffered chunk(s).")
+                consumer.cancel()
+                return False
+            print(f"WARNING: FlowControl - No sink write completed for {timeout:.0f}s, aborting the sinks.")
+            abort_sinks()
+            aborted = True
+            self.last_progress = time.monotonic()
+
+    def store_stats(self, result_container):
+        result_container['pause_count'] = self.pause_count
+        result_container['paused_seconds'] = self.paused_seconds
+        result_container['peak_buffer_bytes'] = self.peak_buffered_bytes
+
+
+def _stall_reason(chunk_buffer, stall_timeout_seconds):
+    # Called after stall_timeout_seconds without a message; returns None while the quiet is expected
+    if not chunk_buffer.paused:
+        return f"stream stalled, no audio for {stall_timeout_seconds:.0f}s"
+    # A stream paused for backpressure is expected to be quiet, as long as the sinks keep writing
+    if time.monotonic() - chunk_buffer.last_progress >= stall_timeout_seconds:
+        return f"audio sinks stalled, nothing written for {stall_timeout_seconds:.0f}s"
+    return None
+
+
+def _abort_output_stream(stream):
+    # Pa_AbortStream returns a blocked write at once, unlike stop_stream() which waits for the buffers to play out.
+    # PyAudio only exposes it through its C module.
+    try:
+        pyaudio._portaudio.abort_stream(stream._stream)
+    except Exception as e:
+        print(f"WARNING: Could not abort the PyAudio stream: {e}")
+
+
+async def _wait_for_message(message_task, consumer, timeout=None):
+    # Waits for the next server message while watching the drain task. Returns False on timeout.
+    # A failed sink is re-raised here, since a paused stream would otherwise never deliver another message.
+    done, _ = await asyncio.wait({message_task, consumer}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    if consumer in done:
+        consumer.result()
+        raise RuntimeError("audio sinks stopped before the stream ended")
+    return message_task in done
+
+
 # --- Operator to add audio to the Video Sequence Editor ---
 class COMPOSER4U_OT_AddAudioToTimeline(bpy.types.Operator):
     bl_idname = "composer4u.add_audio_to_timeline"
@@ -205,12 +793,12 @@ class COMPOSER4U_OT_StopGeneration(bpy.types.Operator):
 
     @classmethod
     def poll(cls, context):
-        return COMPOSER4U_OT_SendPrompt._async_task_future is not None and \
-               not COMPOSER4U_OT_SendPrompt._async_task_future.done()
+        return _get_running_generation_future() is not None
 
     def execute(self, context):
-        if COMPOSER4U_OT_SendPrompt._async_task_future:
-            COMPOSER4U_OT_SendPrompt._async_task_future.cancel()
+        future = _get_running_generation_future()
+        if future:
+            future.cancel()
             self.report({'INFO'}, "Sent stop request to music generation task.")
             print("DEBUG: StopGeneration - Sent stop request.")
             return {'FINISHED'}
@@ -224,14 +812,15 @@ class COMPOSER4U_OT_SendPrompt(bpy.types.Operator):
     bl_options = {'REGISTER', 'UNDO'}
 
     _timer = None
-    _async_task_future = None
-    _result_container = {} # Container to get results back from the async task
+    _future = None # Future of the task this modal instance waits for
+    _async_task_future = None # Future of the most recent task, shared with the Stop operator
+    _result_container = {} # Container of the most recent task; each modal keeps its own reference
 
     @classmethod
     def poll(cls, context):
         if genai is None: return False
         addon_prefs = context.preferences.addons[__package__].preferences # Use the correct preferences class
-        return bool(addon_prefs.api_key) and (cls._async_task_future is None or cls._async_task_future.done())
+        return bool(addon_prefs.api_key) and _get_running_generation_future() is None
 
     def invoke(self, context, event):
         addon_prefs = context.preferences.addons[__package__].preferences # Use the correct preferences class
@@ -250,6 +839,7 @@ class COMPOSER4U_OT_SendPrompt(bpy.types.Operator):
             self.report({'ERROR'}, "Output folder is invalid.")
             return {'CANCELLED'}
 
+        previous_audio_path = bpy.path.abspath(scene.composer4u_last_audio_path) if scene.composer4u_last_audio_path else ""
         scene.composer4u_history.add().text = f"Prompt: {prompt}"
         scene.composer4u_input = ""
         scene.composer4u_last_audio_path = ""
@@ -259,10 +849,21 @@ class COMPOSER4U_OT_SendPrompt(bpy.types.Operator):
         print("DEBUG: SendPrompt - Starting music generation...")
         
         # Reset the result container and submit the task
-        self._result_container.clear()
-        COMPOSER4U_OT_SendPrompt._async_task_future = _submit_async_task_to_background(
-            self._generate_music_async(addon_prefs.api_key, prompt, output_folder, self._result_container)
+        # A fresh container per task, so a stopped task still flushing never writes into the next one
+        self._result_container = {
+            'prompt': prompt, # Kept so the history entry can be extended later
+            'previous_audio_path': previous_audio_path,
+        }
+        COMPOSER4U_OT_SendPrompt._result_container = self._result_container
+        self._future = _submit_async_task_to_background(
+            self._generate_music_async(addon_prefs.api_key, prompt, output_folder, self._result_container,
+                                       *_get_buffer_watermarks(addon_prefs),
+                                       _SilenceDetector(addon_prefs.silence_rms_threshold_db,
+                                                        addon_prefs.silence_peak_threshold_db,
+                                                        addon_prefs.silence_timeout_seconds),
+                                       addon_prefs.stall_timeout_seconds, addon_prefs.trim_trailing_silence)
         )
+        COMPOSER4U_OT_SendPrompt._async_task_future = self._future
         
         wm = context.window_manager
         self._timer = wm.event_timer_add(0.1, window=context.window)
@@ -270,9 +871,9 @@ class COMPOSER4U_OT_SendPrompt(bpy.types.Operator):
         return {'RUNNING_MODAL'}
 
     def modal(self, context, event):
-        future = COMPOSER4U_OT_SendPrompt._async_task_future
+        future = self._future
         
-        if not (future and future.done()):
+        if future is None or _is_task_running(future, self._result_container):
             return {'PASS_THROUGH'}
 
         audio_filepath = None
@@ -326,8 +927,18 @@ class COMPOSER4U_OT_SendPrompt(bpy.types.Operator):
 
 
         # Add the final message to history
-        context.scene.composer4u_history.add().text = f"Composer4U: {message_for_user}"
+        history_item = context.scene.composer4u_history.add()
+        history_item.text = (f"Composer4U: {message_for_user}{self._result_container.get('trim_note', '')}"
+                             f"{_format_flow_stats(self._result_container)}")
+        history_item.prompt = self._result_container.get('prompt', "")
+        history_item.audio_path = context.scene.composer4u_last_audio_path
         context.scene.composer4u_index = len(context.scene.composer4u_history) - 1
+
+        # The new take is now the active one, so the previous take can be archived
+        previous_audio_path = self._result_container.get('previous_audio_path')
+        if context.scene.composer4u_last_audio_path and previous_audio_path and \
+                os.path.normpath(previous_audio_path) != os.path.normpath(context.scene.composer4u_last_audio_path):
+            _queue_transcode(previous_audio_path, context.preferences.addons[__package__].preferences)
         
         self._cleanup(context) # Clean up timer and future
         context.area.tag_redraw() # Force UI redraw
@@ -336,8 +947,8 @@ class COMPOSER4U_OT_SendPrompt(bpy.types.Operator):
 
     def cancel(self, context):
         # Called if user presses ESC or clicks outside pop-up (if invoke_props_dialog)
-        if COMPOSER4U_OT_SendPrompt._async_task_future and not COMPOSER4U_OT_SendPrompt._async_task_future.done():
-            COMPOSER4U_OT_SendPrompt._async_task_future.cancel()
+        if self._future and not self._future.done():
+            self._future.cancel()
             self.report({'INFO'}, "Generation cancelled by user (dialog closed).")
             print("DEBUG: Cancel - Async task cancelled via cancel method.")
         self._cleanup(context)
@@ -347,14 +958,23 @@ class COMPOSER4U_OT_SendPrompt(bpy.types.Operator):
             context.window_manager.event_timer_remove(self._timer)
             self._timer = None
             print("DEBUG: Cleanup - Timer removed.")
-        COMPOSER4U_OT_SendPrompt._async_task_future = None
-        print("DEBUG: Cleanup - Async task future cleared.")
-
-    async def _generate_music_async(self, api_key, prompt_text, output_folder, result_container):
+        # Keep the future visible while a stopped task is still flushing, so no new task starts on top of it
+        if COMPOSER4U_OT_SendPrompt._async_task_future is self._future and \
+                not _is_task_running(self._future, self._result_container):
+            COMPOSER4U_OT_SendPrompt._async_task_future = None
+            print("DEBUG: Cleanup - Async task future cleared.")
+
+    async def _generate_music_async(self, api_key, prompt_text, output_folder, result_container,
+                                    high_watermark_bytes, low_watermark_bytes,
+                                    silence_detector, stall_timeout_seconds, trim_trailing_silence):
+        result_container['started'] = True
+        stop_reason = None # Set when the session is ended automatically for silence or a stall
         audio_filepath = None
         wav_writer = None
         p_audio = None
         output_stream = None
+        stop_playback = False # Set on cancellation so audio still buffered is written but not played
+        sinks_abandoned = False # Set when a hung playback write could not be aborted; the stream is then left alone
         
         # Flag to indicate if generation was naturally completed or cancelled by user
         was_cancelled = False 
@@ -400,24 +1020,77 @@ class COMPOSER4U_OT_SendPrompt(bpy.types.Operator):
                 await session.play()
                 print("DEBUG: _generate_music_async - Session play initiated.")
 
-                # Loop to continuously receive audio chunks
-                async for message in session.receive():
-                    if asyncio.current_task().cancelled():
-                        print("DEBUG: _generate_music_async - Task cancelled, breaking loop.")
-                        was_cancelled = True # Set cancellation flag
-                        break # Exit the async for loop immediately
-
-                    if message.server_content:
-                        chunk = message.server_content.audio_chunks[0].data
-                        wav_writer.writeframes(chunk) # Write raw audio bytes to WAV file
-                        if output_stream: # Only write to pyaudio if stream is successfully opened
-                            output_stream.write(chunk) # Play raw audio bytes
-                    elif message.filtered_prompt:
-                        # If the prompt was filtered by the API, raise an error
-                        raise Exception(f"Prompt filtered by API: {message.filtered_prompt.reason}")
+                def write_to_sinks(chunk):
+                    wav_writer.writeframes(chunk) # Write raw audio bytes to WAV file
+                    if output_stream and not stop_playback: # Only write to pyaudio if stream is successfully opened
+                        output_stream.write(chunk) # Play raw audio bytes
+
+                def abort_playback():
+                    # Drops playback for the rest of the flush so the remaining chunks go only to the WAV file
+                    nonlocal stop_playback
+                    stop_playback = True
+                    if output_stream:
+                        _abort_output_stream(output_stream)
+
+                # The receive loop only enqueues; the sinks consume at their own pace and
+                # the buffer pauses the server stream when they fall behind
+                chunk_buffer = _FlowControlledChunkBuffer(session, high_watermark_bytes, low_watermark_bytes)
+                consumer = asyncio.ensure_future(chunk_buffer.drain(write_to_sinks))
+                receiver = session.receive().__aiter__()
+                next_message = None
+                try:
+                    # Loop to continuously receive audio chunks, waiting at most stall_timeout_seconds for each
+                    while True:
+                        if next_message is None:
+                            next_message = asyncio.ensure_future(receiver.__anext__())
+                        if not await _wait_for_message(next_message, consumer, stall_timeout_seconds or None):
+                            stop_reason = _stall_reason(chunk_buffer, stall_timeout_seconds)
+                            if stop_reason is None:
+                                continue
+                            if chunk_buffer.paused:
+                                # Playback is the sink that blocks; abort it before the flush so the rest reaches the WAV
+                                abort_playback()
+                            break
+                        try:
+                            message = next_message.result()
+                        except StopAsyncIteration:
+                            break
+                        finally:
+                            next_message = None
+
+                        if asyncio.current_task().cancelled():
+                            print("DEBUG: _generate_music_async - Task cancelled, breaking loop.")
+                            was_cancelled = True # Set cancellation flag
+                            break # Exit the loop immediately
+
+                        if message.server_content:
+                            chunk = message.server_content.audio_chunks[0].data
+                            limit_reached = silence_detector.feed(chunk)
+                            await chunk_buffer.put(chunk)
+                            if limit_reached:
+                                stop_reason = f"silence for {silence_detector.silent_frames / OUTPUT_RATE:.0f}s"
+                                break
+                        elif message.filtered_prompt:
+                            # If the prompt was filtered by the API, raise an error
+                            raise Exception(f"Prompt filtered by API: {message.filtered_prompt.reason}")
+                except asyncio.CancelledError:
+                    stop_playback = True
+                    raise
+                finally:
+                    if next_message is not None:
+                        next_message.cancel()
+                    # Flush whatever is still buffered to the WAV file before it is closed
+                    try:
+                        sinks_abandoned = not await chunk_buffer.finish(consumer, abort_playback)
+                    finally:
+                        chunk_buffer.store_stats(result_container)
             
-            # This block is reached if the 'async for' loop completes (either naturally or by break)
-            if not was_cancelled:
+            # This block is reached if the receive loop completes (either naturally or by break)
+            if stop_reason:
+                result_container['message'] = f"Stopped automatically: {stop_reason}."
+                self.report({'INFO'}, f"Music generation stopped automatically: {stop_reason}.")
+                print(f"DEBUG: _generate_music_async - Generation stopped automatically: {stop_reason}.")
+            elif not was_cancelled:
                 # If generation finished without being cancelled, set success message
                 result_container['message'] = "Music generated successfully."
                 self.report({'INFO'}, "Music generation finished successfully.")
@@ -454,16 +1127,559 @@ class COMPOSER4U_OT_SendPrompt(bpy.types.Operator):
             if wav_writer: 
                 wav_writer.close() # This is crucial for finalizing the WAV header
                 print("DEBUG: _generate_music_async - WAV writer closed.")
-            if output_stream:
+                # Trim trailing silence from any take that is kept (finished, auto-stopped or stopped by user)
+                kept_path = result_container.get('audio_filepath')
+                if trim_trailing_silence and kept_path and os.path.exists(kept_path):
+                    keep_frames = silence_detector.last_sound_frame + int(SILENCE_TRIM_PADDING_SECONDS * OUTPUT_RATE)
+                    if keep_frames < silence_detector.frames_seen:
+                        try:
+                            trimmed_frames = _truncate_wav(kept_path, keep_frames)
+                            result_container['trim_note'] = f" Trimmed {trimmed_frames / OUTPUT_RATE:.1f}s of trailing silence."
+                            print(f"DEBUG: _generate_music_async - Trimmed {trimmed_frames} silent frames.")
+                        except (wave.Error, OSError) as e:
+                            print(f"WARNING: _generate_music_async - Could not trim trailing silence: {e}")
+            if sinks_abandoned:
+                # A write may still be blocked inside PortAudio; closing under it is unsafe, so leak the stream instead
+                print("WARNING: _generate_music_async - Playback sink hung, leaving the PyAudio stream open.")
+            elif output_stream:
                 output_stream.stop_stream()
                 output_stream.close()
                 print("DEBUG: _generate_music_async - PyAudio stream stopped and closed.")
-            if p_audio: 
+            if p_audio and not sinks_abandoned:
                 p_audio.terminate()
                 print("DEBUG: _generate_music_async - PyAudio terminated.")
+            result_container['finalized'] = True # The modal handler waits for this after a stop request
             print("DEBUG: _generate_music_async - Finally block completed.")
 
 
+# --- Extend Track Operator (Modal) ---
+class COMPOSER4U_OT_ExtendTrack(bpy.types.Operator):
+    bl_idname = "composer4u.extend_track"
+    bl_label = "Extend Track"
+    bl_description = "Continue generating with the original prompt and append the result to the existing audio file"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    _timer = None
+    _future = None # Future of the task this modal instance waits for
+    _async_task_future = None # Future of the most recent task, shared with the Stop operator
+    _result_container = {} # Container of the most recent task; each modal keeps its own reference
+
+    @classmethod
+    def poll(cls, context):
+        if genai is None: return False
+        addon_prefs = context.preferences.addons[__package__].preferences
+        return bool(addon_prefs.api_key) and _get_running_generation_future() is None
+
+    @staticmethod
+    def _find_source(context):
+        # A selected Composer4U strip in the VSE takes priority over the active history entry
+        scene = context.scene
+        history = scene.composer4u_history
+        filepath = ""
+        seq_editor = scene.sequence_editor
+        strip = seq_editor.active_strip if seq_editor else None
+        if strip and strip.select and strip.type == 'SOUND' and strip.name.startswith("Composer4U") and strip.sound:
+            filepath = bpy.path.abspath(strip.sound.filepath)
+        elif 0 <= scene.composer4u_index < len(history):
+            filepath = bpy.path.abspath(history[scene.composer4u_index].audio_path) if history[scene.composer4u_index].audio_path else ""
+        if not filepath:
+            filepath = bpy.path.abspath(scene.composer4u_last_audio_path) if scene.composer4u_last_audio_path else ""
+
+        # Look up the prompt of the most recent history entry that produced this file
+        prompt = ""
+        for item in reversed(history):
+            if item.audio_path and item.prompt and os.path.normpath(bpy.path.abspath(item.audio_path)) == os.path.normpath(filepath):
+                prompt = item.prompt
+                break
+        return filepath, prompt
+
+    def invoke(self, context, event):
+        addon_prefs = context.preferences.addons[__package__].preferences
+        if not addon_prefs.api_key:
+            self.report({'ERROR'}, "Google Gemini API Key not set.")
+            return {'CANCELLED'}
+
+        scene = context.scene
+        filepath, prompt = self._find_source(context)
+        if not filepath or not os.path.exists(filepath):
+            self.report({'ERROR'}, "No existing Composer4U audio file selected to extend.")
+            return {'CANCELLED'}
+        if not prompt:
+            self.report({'ERROR'}, "Original prompt for this audio file not found in history.")
+            return {'CANCELLED'}
+
+        # Validate the file up front so the user gets an immediate error instead of a failed session
+        try:
+            _WavAppender(filepath).close()
+        except (wave.Error, OSError) as e:
+            self.report({'ERROR'}, f"Cannot extend '{os.path.basename(filepath)}': {e}")
+            return {'CANCELLED'}
+
+        seconds = scene.composer4u_extend_seconds
+        scene.composer4u_history.add().text = f"Extend: {os.path.basename(filepath)} by {seconds:.1f}s"
+        scene.composer4u_index = len(scene.composer4u_history) - 1
+
+        self.report({'INFO'}, "Extending track...")
+        print(f"DEBUG: ExtendTrack - Extending {filepath} by {seconds}s.")
+
+        self._result_container = {'audio_filepath': filepath, 'prompt': prompt}
+        COMPOSER4U_OT_ExtendTrack._result_container = self._result_container
+        self._future = _submit_async_task_to_background(
+            self._extend_music_async(addon_prefs.api_key, prompt, filepath, seconds, self._result_container,
+                                     *_get_buffer_watermarks(addon_prefs), addon_prefs.stall_timeout_seconds)
+        )
+        COMPOSER4U_OT_ExtendTrack._async_task_future = self._future
+
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.1, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        future = self._future
+
+        if future is None or _is_task_running(future, self._result_container):
+            return {'PASS_THROUGH'}
+
+        audio_filepath = self._result_container.get('audio_filepath')
+        try:
+            future.result()
+            message_for_user = self._result_container.get('message', "Track extended successfully.")
+        except Exception as e:
+            if isinstance(e, (asyncio.CancelledError, concurrent.futures.CancelledError)):
+                # The header is patched after every chunk, so whatever was appended is kept
+                message_for_user = "Extension stopped by user."
+                self.report({'INFO'}, "Extension stopped.")
+            else:
+                message_for_user = f"Error: {e}"
+                self.report({'ERROR'}, f"Track extension failed: {e}")
+                print(f"ERROR: ExtendTrack - Extension failed with unexpected exception: {e}")
+                traceback.print_exc(file=sys.stderr)
+
+        if audio_filepath and os.path.exists(audio_filepath):
+            self._update_strips(context, audio_filepath)
+            context.scene.composer4u_last_audio_path = audio_filepath
+
+        history_item = context.scene.composer4u_history.add()
+        history_item.text = f"Composer4U: {message_for_user}{_format_flow_stats(self._result_container)}"
+        history_item.prompt = self._result_container.get('prompt', "")
+        history_item.audio_path = audio_filepath or ""
+        context.scene.composer4u_index = len(context.scene.composer4u_history) - 1
+
+        self._cleanup(context)
+        if context.area:
+            context.area.tag_redraw()
+        return {'FINISHED'}
+
+    def _update_strips(self, context, audio_filepath):
+        # Reload every VSE strip that plays this file and stretch it by the appended audio in place
+        scene = context.scene
+        if not scene.sequence_editor:
+            return
+        # Grow by what was appended so trimmed heads (frame_offset_start) are left untouched
+        fps = scene.render.fps / scene.render.fps_base
+        added_length = int(round(self._result_container.get('frames_appended', 0) / OUTPUT_RATE * fps))
+        target = os.path.normpath(audio_filepath)
+        strips = [strip for strip in scene.sequence_editor.sequences_all
+                  if strip.type == 'SOUND' and strip.sound and
+                  os.path.normpath(bpy.path.abspath(strip.sound.filepath)) == target]
+        # Only strips that end at the old end of the file continue into the new audio. Split pieces and
+        # strips with a trimmed tail keep their length, so they neither overlap their neighbours nor expose new audio.
+        ending_at_old_end = {strip.name for strip in strips if strip.frame_offset_end == 0}
+        for sound in {strip.sound for strip in strips}:
+            try:
+                sound.filepath = sound.filepath # Re-assigning forces Blender to reload the sound data
+            except Exception as e:
+                print(f"WARNING: ExtendTrack - Could not reload sound '{sound.name}': {e}")
+        for strip in strips:
+            if strip.name not in ending_at_old_end or added_length <= 0:
+                continue
+            try:
+                strip.frame_final_duration += added_length
+                print(f"DEBUG: ExtendTrack - Grew strip '{strip.name}' by {added_length} frames.")
+            except Exception as e:
+                print(f"WARNING: ExtendTrack - Could not update strip '{strip.name}': {e}")
+
+    def cancel(self, context):
+        if self._future and not self._future.done():
+            self._future.cancel()
+        self._cleanup(context)
+
+    def _cleanup(self, context):
+        if self._timer:
+            context.window_manager.event_timer_remove(self._timer)
+            self._timer = None
+        if COMPOSER4U_OT_ExtendTrack._async_task_future is self._future and \
+                not _is_task_running(self._future, self._result_container):
+            COMPOSER4U_OT_ExtendTrack._async_task_future = None
+
+    async def _extend_music_async(self, api_key, prompt_text, audio_filepath, seconds, result_container,
+                                  high_watermark_bytes, low_watermark_bytes, stall_timeout_seconds):
+        result_container['started'] = True
+        stop_reason = None # Set when the session stalls before the target length is reached
+        appender = None
+        target_frames = int(seconds * OUTPUT_RATE)
+
+        print(f"DEBUG: _extend_music_async - Extending '{audio_filepath}' by {seconds}s.")
+
+        try:
+            client = genai.Client(api_key=api_key, http_options={'api_version': 'v1alpha'})
+            appender = _WavAppender(audio_filepath)
+
+            async with client.aio.live.music.connect(model=MODEL) as session:
+                await session.set_weighted_prompts(prompts=[types.WeightedPrompt(text=prompt_text, weight=1.0)])
+                await session.play()
+
+                # Work is proportional to the added duration only: chunks go straight to the end of the file
+                chunk_buffer = _FlowControlledChunkBuffer(session, high_watermark_bytes, low_watermark_bytes)
+                consumer = asyncio.ensure_future(chunk_buffer.drain(appender.append))
+                # The crossfaded frames overlap the existing tail, so receive that much more
+                frames_needed = target_frames + appender.fade_frames
+                frames_received = 0
+                receiver = session.receive().__aiter__()
+                next_message = None
+                try:
+                    while True:
+                        if next_message is None:
+                            next_message = asyncio.ensure_future(receiver.__anext__())
+                        if not await _wait_for_message(next_message, consumer, stall_timeout_seconds or None):
+                            stop_reason = _stall_reason(chunk_buffer, stall_timeout_seconds)
+                            if stop_reason is None:
+                                continue
+                            break
+                        try:
+                            message = next_message.result()
+                        except StopAsyncIteration:
+                            break
+                        finally:
+                            next_message = None
+
+                        if message.server_content:
+                            chunk = message.server_content.audio_chunks[0].data
+                            frames_received += len(chunk) // appender.frame_bytes
+                            await chunk_buffer.put(chunk)
+                            if frames_received >= frames_needed:
+                                break
+                        elif message.filtered_prompt:
+                            raise Exception(f"Prompt filtered by API: {message.filtered_prompt.reason}")
+                finally:
+                    if next_message is not None:
+                        next_message.cancel()
+                    try:
+                        await chunk_buffer.finish(consumer)
+                    finally:
+                        chunk_buffer.store_stats(result_container)
+
+            result_container['message'] = f"Track extended by {appender.frames_appended / OUTPUT_RATE:.1f}s."
+            if stop_reason:
+                result_container['message'] = f"Stopped automatically: {stop_reason}. " + result_container['message']
+                print(f"DEBUG: _extend_music_async - Extension stopped automatically: {stop_reason}.")
+            else:
+                print("DEBUG: _extend_music_async - Extension completed.")
+        finally:
+            # Closing flushes any held-back crossfade audio; the existing audio is never removed
+            if appender:
+                appender.close()
+                result_container['frames_appended'] = appender.frames_appended
+                print(f"DEBUG: _extend_music_async - Appended {appender.frames_appended} frames.")
+            result_container['finalized'] = True
+
+
+# --- Auto-Duck Operator (Modal) ---
+# Analysis runs in the process pool; the modal timer only polls futures and applies the result.
+class COMPOSER4U_OT_AutoDuck(bpy.types.Operator):
+    bl_idname = "composer4u.auto_duck"
+    bl_label = "Auto-Duck Under Dialogue"
+    bl_description = "Lower the Composer4U music strip's volume wherever the dialogue channels have speech"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    _timer = None
+
+    @classmethod
+    def poll(cls, context):
+        return ducking.np is not None and context.scene.sequence_editor is not None
+
+    @staticmethod
+    def _find_music_strip(scene):
+        # The active strip wins if it is a Composer4U strip, otherwise the first one on the timeline
+        seq_editor = scene.sequence_editor
+        strip = seq_editor.active_strip
+        if strip and strip.type == 'SOUND' and strip.name.startswith("Composer4U") and strip.sound:
+            return strip
+        for strip in seq_editor.sequences_all:
+            if strip.type == 'SOUND' and strip.name.startswith("Composer4U") and strip.sound:
+                return strip
+        return None
+
+    def invoke(self, context, event):
+        scene = context.scene
+        music_strip = self._find_music_strip(scene)
+        if music_strip is None:
+            self.report({'ERROR'}, "No Composer4U music strip found in the VSE.")
+            return {'CANCELLED'}
+        try:
+            channels = {int(c) for c in scene.composer4u_duck_channels.replace(" ", "").split(",") if c}
+        except ValueError:
+            self.report({'ERROR'}, "Dialogue channels must be comma-separated numbers, e.g. 2,3")
+            return {'CANCELLED'}
+
+        fps = scene.render.fps / scene.render.fps_base
+        self._fps = fps
+        # Each source is (filepath, offset_seconds, visible_start_seconds, visible_end_seconds, volume)
+        self._sources = []
+        skipped = 0
+        for strip in scene.sequence_editor.sequences_all:
+            if strip == music_strip or strip.type != 'SOUND' or strip.channel not in channels or strip.mute or not strip.sound:
+                continue
+            path = bpy.path.abspath(strip.sound.filepath)
+            # Memory-mapped analysis needs uncompressed WAV sources
+            if not path.lower().endswith(".wav") or not os.path.exists(path):
+                skipped += 1
+                continue
+            self._sources.append((path, strip.frame_start / fps, strip.frame_final_start / fps,
+                                  strip.frame_final_end / fps, strip.volume))
+        if skipped:
+            self.report({'WARNING'}, f"Skipped {skipped} dialogue strip(s) that are not WAV files.")
+        if not self._sources:
+            self.report({'ERROR'}, f"No WAV dialogue strips found on channel(s) {scene.composer4u_duck_channels}.")
+            return {'CANCELLED'}
+
+        self._music_name = music_strip.name
+        # Always analyse and render from the original music, never from an earlier pre-mixed render
+        self._music_path = music_strip.get("composer4u_source_path") or bpy.path.abspath(music_strip.sound.filepath)
+        if not os.path.exists(self._music_path):
+            self.report({'ERROR'}, f"Original music file {self._music_path} is missing.")
+            return {'CANCELLED'}
+        if scene.composer4u_duck_render and not self._music_path.lower().endswith(".wav"):
+            # An archived take can still be ducked with keyframes, but the renderer reads WAV only
+            self.report({'ERROR'}, f"Pre-mixed rendering needs a WAV source, {os.path.basename(self._music_path)} "
+                                   "is archived. Use keyframe ducking instead.")
+            return {'CANCELLED'}
+        self._music_offset = music_strip.frame_start / fps
+        self._music_range = (music_strip.frame_final_start / fps, music_strip.frame_final_end / fps)
+        self._settings = (scene.composer4u_duck_threshold_db, scene.composer4u_duck_amount_db,
+                          scene.composer4u_duck_attack, scene.composer4u_duck_release)
+        self._render = scene.composer4u_duck_render
+        self._gain_future = None
+        self._render_future = None
+
+        pool = _get_process_pool()
+        self._envelope_futures = {
+            path: pool.submit(ducking.compute_rms_envelope, path, ducking.ENVELOPE_HOP_SECONDS, ducking.ENVELOPE_CACHE_DIR)
+            for path in {source[0] for source in self._sources}
+        }
+        self.report({'INFO'}, f"Analysing {len(self._envelope_futures)} dialogue file(s) in the background...")
+        print(f"DEBUG: AutoDuck - Submitted {len(self._envelope_futures)} envelope job(s) for '{self._music_name}'.")
+
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.2, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        try:
+            message = self._advance(context)
+        except Exception as e:
+            if isinstance(e, concurrent.futures.BrokenExecutor):
+                _shutdown_process_pool() # A crashed worker leaves the pool unusable, start fresh next time
+            self.report({'ERROR'}, f"Auto-ducking failed: {e}")
+            print(f"ERROR: AutoDuck - Auto-ducking failed: {e}")
+            traceback.print_exc(file=sys.stderr)
+            message = f"Error: Auto-ducking failed: {e}"
+        if message is None:
+            return {'PASS_THROUGH'}
+
+        context.scene.composer4u_history.add().text = f"Composer4U: {message}"
+        context.scene.composer4u_index = len(context.scene.composer4u_history) - 1
+        self._cleanup(context)
+        if context.area:
+            context.area.tag_redraw()
+        return {'FINISHED'}
+
+    def _advance(self, context):
+        # Moves the job through envelopes -> gain curve -> (optional) render; returns a message once finished
+        pool = _get_process_pool()
+        if self._gain_future is None:
+            if not all(future.done() for future in self._envelope_futures.values()):
+                return None
+            envelopes = {}
+            self._cache_hits = 0
+            for path, future in self._envelope_futures.items():
+                envelopes[path], cache_hit = future.result()
+                self._cache_hits += int(cache_hit)
+            sources = [(envelopes[path], offset, start, end, volume) for path, offset, start, end, volume in self._sources]
+            self._gain_future = pool.submit(ducking.build_gain_curve, sources, *self._music_range,
+                                            ducking.ENVELOPE_HOP_SECONDS, *self._settings)
+            return None
+
+        if self._render_future is None:
+            if not self._gain_future.done():
+                return None
+            times, gains_db = self._gain_future.result()
+            if self._render:
+                output_path = os.path.splitext(self._music_path)[0] + "_ducked.wav"
+                self._render_future = pool.submit(ducking.render_ducked_wav, self._music_path, output_path,
+                                                  self._music_offset, times, gains_db)
+                return None
+            strip = context.scene.sequence_editor.sequences_all.get(self._music_name)
+            if strip is None:
+                raise RuntimeError(f"Strip '{self._music_name}' no longer exists")
+            if "composer4u_source_path" in strip:
+                # The strip plays an earlier pre-mixed render; keyframes apply to the original music
+                self._link_own_sound(strip, strip["composer4u_source_path"])
+            count, replaced = self._write_volume_keyframes(context, strip, times, gains_db)
+            replaced_note = ""
+            if replaced:
+                replaced_note = f" Replaced {replaced} existing volume keyframe(s) inside the ducked range."
+                self.report({'WARNING'}, f"Replaced {replaced} existing volume keyframe(s) on '{strip.name}'.")
+            else:
+                self.report({'INFO'}, f"Ducked '{strip.name}' with {count} volume keyframes.")
+            return (f"Ducked '{strip.name}' under {len(self._sources)} dialogue strip(s), "
+                    f"{count} keyframes ({self._cache_hits}/{len(self._envelope_futures)} envelopes cached).{replaced_note}")
+
+        if not self._render_future.done():
+            return None
+        output_path = self._render_future.result()
+        strip = context.scene.sequence_editor.sequences_all.get(self._music_name)
+        if strip is None:
+            raise RuntimeError(f"Strip '{self._music_name}' no longer exists")
+        strip["composer4u_source_path"] = self._music_path
+        # The render already contains the ducking, keyframes from an earlier keyframe run would duck twice
+        self._remove_volume_keyframes(context, strip)
+        self._link_own_sound(strip, output_path)
+        self.report({'INFO'}, f"Relinked '{strip.name}' to pre-mixed {os.path.basename(output_path)}.")
+        return f"Rendered ducked mix to {os.path.basename(output_path)}."
+
+    @staticmethod
+    def _link_own_sound(strip, filepath):
+        # Point only this strip at filepath; changing strip.sound.filepath would relink every strip sharing the Sound
+        sound = bpy.data.sounds.load(filepath, check_existing=True)
+        sound.filepath = sound.filepath # Re-assigning forces Blender to reload a re-rendered file
+        strip.sound = sound
+
+    @staticmethod
+    def _find_volume_fcurve(context, strip):
+        # Returns (fcurves, fcurve) for the strip's volume, either may be None
+        scene = context.scene
+        action = scene.animation_data.action if scene.animation_data else None
+        fcurves = getattr(action, "fcurves", None)
+        fcurve = fcurves.find(strip.path_from_id("volume")) if fcurves is not None else None
+        return fcurves, fcurve
+
+    @staticmethod
+    def _remove_keyframes_in_range(fcurve, start_frame, end_frame):
+        # Removes the keys inside [start_frame, end_frame]; the editor's automation around it stays
+        points = fcurve.keyframe_points
+        inside = [i for i, point in enumerate(points) if start_frame <= point.co[0] <= end_frame]
+        for i in reversed(inside):
+            points.remove(points[i], fast=True)
+        return len(inside)
+
+    def _remove_volume_keyframes(self, context, strip):
+        # Only the keys written by an earlier keyframe run are removed, hand-set fades are kept
+        ducked_range = strip.get("composer4u_ducked_range")
+        if ducked_range is None:
+            return
+        del strip["composer4u_ducked_range"]
+        fcurves, fcurve = self._find_volume_fcurve(context, strip)
+        if fcurve is not None:
+            self._remove_keyframes_in_range(fcurve, *ducked_range)
+            if not len(fcurve.keyframe_points):
+                fcurves.remove(fcurve)
+        elif fcurves is None and context.scene.animation_data and context.scene.animation_data.action:
+            print(f"WARNING: AutoDuck - Could not remove volume keyframes of '{strip.name}' from this action layout.")
+        strip.volume = strip.get("composer4u_base_volume", strip.volume)
+
+    def _write_volume_keyframes(self, context, strip, times, gains_db):
+        # Returns (keyframes written, existing keyframes of the editor that were replaced)
+        # Keep the un-ducked volume so running the operator again does not duck twice
+        base_volume = strip.get("composer4u_base_volume", strip.volume)
+        strip["composer4u_base_volume"] = base_volume
+        frames = [t * self._fps for t in times.tolist()]
+        values = [base_volume * 10.0 ** (g / 20.0) for g in gains_db.tolist()]
+        start_frame, end_frame = frames[0], frames[-1]
+
+        # Keys inside the range of an earlier run are ours; any other key in the new range is the editor's
+        previous_range = strip.get("composer4u_ducked_range")
+        _, fcurve = self._find_volume_fcurve(context, strip)
+        replaced = 0
+        if fcurve is not None:
+            replaced = sum(1 for point in fcurve.keyframe_points
+                           if start_frame <= point.co[0] <= end_frame and
+                           not (previous_range and previous_range[0] <= point.co[0] <= previous_range[1]))
+        strip["composer4u_ducked_range"] = (start_frame, end_frame)
+
+        strip.volume = values[0]
+        strip.keyframe_insert("volume", frame=frames[0])
+        _, fcurve = self._find_volume_fcurve(context, strip)
+        if fcurve is None:
+            # Slow path for action layouts without direct F-Curve access
+            for frame, value in zip(frames, values):
+                strip.volume = value
+                strip.keyframe_insert("volume", frame=frame)
+            return len(frames), replaced
+
+        if previous_range:
+            self._remove_keyframes_in_range(fcurve, *previous_range)
+        self._remove_keyframes_in_range(fcurve, start_frame, end_frame)
+
+        # Add the whole range in one call, inserting thousands of keys one by one is slow
+        points = fcurve.keyframe_points
+        kept = len(points)
+        points.add(len(frames))
+        coords = [0.0] * (2 * len(points))
+        points.foreach_get("co", coords)
+        coords[2 * kept:] = [c for pair in zip(frames, values) for c in pair]
+        points.foreach_set("co", coords)
+        for point in list(points)[kept:]:
+            point.interpolation = 'LINEAR'
+        fcurve.update() # Sorts the new keys in between the kept ones
+        return len(frames), replaced
+
+    def cancel(self, context):
+        for future in list(getattr(self, "_envelope_futures", {}).values()) + [self._gain_future, self._render_future]:
+            if future is not None:
+                future.cancel()
+        self._cleanup(context)
+
+    def _cleanup(self, context):
+        if self._timer:
+            context.window_manager.event_timer_remove(self._timer)
+            self._timer = None
+
+
+# --- Operator to archive inactive takes ---
+class COMPOSER4U_OT_TranscodeTakes(bpy.types.Operator):
+    bl_idname = "composer4u.transcode_takes"
+    bl_label = "Archive Inactive Takes"
+    bl_description = "Transcode every take in the history except the active one to the format set in the add-on preferences"
+    bl_options = {'REGISTER'}
+
+    @classmethod
+    def poll(cls, context):
+        if aud is None: return False
+        addon_prefs = context.preferences.addons[__package__].preferences
+        return addon_prefs.transcode_format != 'NONE'
+
+    def execute(self, context):
+        addon_prefs = context.preferences.addons[__package__].preferences
+        queued = 0
+        for item in context.scene.composer4u_history:
+            if not item.audio_path:
+                continue
+            wav_path = bpy.path.abspath(item.audio_path)
+            if not _is_active_take(wav_path) and _queue_transcode(wav_path, addon_prefs):
+                queued += 1
+        if not queued:
+            self.report({'INFO'}, "No inactive WAV takes to archive.")
+            return {'CANCELLED'}
+        self.report({'INFO'}, f"Archiving {queued} take(s) in the background...")
+        return {'FINISHED'}
+
+
 # --- Pop-up Dialog Operator ---
 # This operator is used to display the UI in a popup window.
 # The UI content itself is drawn using the draw method.
@@ -483,7 +1699,7 @@ class COMPOSER4U_OT_OpenDialog(bpy.types.Operator):
         layout.label(text="Composition History:", icon='INFO')
         layout.template_list("COMPOSER4U_UL_History", "", scene, "composer4u_history", scene, "composer4u_index", rows=10)
         
-        is_generating = COMPOSER4U_OT_SendPrompt._async_task_future and not COMPOSER4U_OT_SendPrompt._async_task_future.done()
+        is_generating = _get_running_generation_future() is not None
         
         row = layout.row(align=True)
         if is_generating:
@@ -503,8 +1719,34 @@ class COMPOSER4U_OT_OpenDialog(bpy.types.Operator):
             row.label(text=os.path.basename(scene.composer4u_last_audio_path), icon='FILE_SOUND')
             op = row.operator("composer4u.add_audio_to_timeline", text="Add to VSE", icon='PLAY_SOUND') 
             op.filepath = scene.composer4u_last_audio_path
+            if not is_generating:
+                row = box.row(align=True)
+                row.prop(scene, "composer4u_extend_seconds")
+                row.operator("composer4u.extend_track", text="Extend", icon='FORWARD')
         elif not is_generating:
             layout.label(text="No audio generated yet.", icon='INFO')
 
+        if scene.sequence_editor and not is_generating:
+            layout.separator()
+            box = layout.box()
+            box.label(text="Auto-Duck Under Dialogue:", icon='SPEAKER')
+            row = box.row(align=True)
+            row.prop(scene, "composer4u_duck_channels")
+            row.prop(scene, "composer4u_duck_threshold_db")
+            row.prop(scene, "composer4u_duck_amount_db")
+            row = box.row(align=True)
+            row.prop(scene, "composer4u_duck_attack")
+            row.prop(scene, "composer4u_duck_release")
+            row.prop(scene, "composer4u_duck_render")
+            box.operator("composer4u.auto_duck", icon='MOD_SOUND')
+
+        if aud is not None and not is_generating:
+            row = layout.row(align=True)
+            row.operator("composer4u.transcode_takes", icon='FILE_ARCHIVE')
+            if _transcode_jobs:
+                row.label(text=f"Archiving {len(_transcode_jobs)} take(s)...", icon='TIME')
+            elif scene.composer4u_transcode_saved_mb > 0:
+                row.label(text=f"Saved {scene.composer4u_transcode_saved_mb:.1f} MB", icon='CHECKMARK')
+
     def execute(self, context):
         return {'FINISHED'}
\ No newline at end of file
@@ -26,7 +26,100 @@ class Composer4UAddonPreferences(bpy.types.AddonPreferences):
         default=""
     )
 
+    # Memory budget for audio received from the server but not yet written or played
+    buffer_high_watermark_mb: bpy.props.FloatProperty(
+        name="Pause Stream Above (MB)",
+        description="Pause the music stream when this much received audio is waiting to be written or played",
+        default=8.0,
+        min=0.5,
+        soft_max=256.0
+    )
+    buffer_low_watermark_mb: bpy.props.FloatProperty(
+        name="Resume Stream Below (MB)",
+        description="Resume the paused music stream once the waiting audio has drained below this size",
+        default=2.0,
+        min=0.0,
+        soft_max=256.0
+    )
+
+    # Archiving of finished takes, the active take always stays WAV so it can be extended
+    transcode_format: bpy.props.EnumProperty(
+        name="Archive Takes As",
+        description="Format that finished takes are transcoded to once a newer take becomes active",
+        items=[
+            ('NONE', "Keep WAV", "Never transcode takes"),
+            ('FLAC', "FLAC", "Lossless, roughly half the size of WAV"),
+            ('OPUS', "Opus", "Compact lossy Ogg/Opus"),
+        ],
+        default='NONE'
+    )
+    opus_bitrate_kbps: bpy.props.IntProperty(
+        name="Opus Bitrate (kbps)",
+        description="Bitrate used when archiving takes as Opus",
+        default=192,
+        min=32,
+        max=510
+    )
+
+    # Silence and stall detection for unattended generations
+    silence_rms_threshold_db: bpy.props.FloatProperty(
+        name="Silence RMS (dBFS)",
+        description="Audio blocks with an RMS level below this (and a peak below the peak threshold) count as silent",
+        default=-50.0,
+        max=0.0,
+        soft_min=-96.0
+    )
+    silence_peak_threshold_db: bpy.props.FloatProperty(
+        name="Silence Peak (dBFS)",
+        description="Audio blocks with a peak level below this (and an RMS below the RMS threshold) count as silent",
+        default=-30.0,
+        max=0.0,
+        soft_min=-96.0
+    )
+    silence_timeout_seconds: bpy.props.FloatProperty(
+        name="Stop After Silence (s)",
+        description="End the session after this many seconds of continuous silence. 0 disables",
+        default=10.0,
+        min=0.0,
+        soft_max=120.0
+    )
+    stall_timeout_seconds: bpy.props.FloatProperty(
+        name="Stall Timeout (s)",
+        description="End the session when no audio arrives for this many seconds. 0 disables",
+        default=15.0,
+        min=0.0,
+        soft_max=120.0
+    )
+    trim_trailing_silence: bpy.props.BoolProperty(
+        name="Trim Trailing Silence",
+        description="Cut silence from the end of a take before the file is finalized",
+        default=True
+    )
+
     def draw(self, context):
         layout = self.layout
         layout.prop(self, "api_key")
-        layout.label(text="Get your API key from Google AI Studio or Google Cloud Console.")
\ No newline at end of file
+        layout.label(text="Get your API key from Google AI Studio or Google Cloud Console.")
+
+        box = layout.box()
+        box.label(text="Stream Buffer (per generation):", icon='MEMORY')
+        row = box.row(align=True)
+        row.prop(self, "buffer_high_watermark_mb")
+        row.prop(self, "buffer_low_watermark_mb")
+
+        box = layout.box()
+        box.label(text="Take Archiving:", icon='FILE_ARCHIVE')
+        row = box.row(align=True)
+        row.prop(self, "transcode_format")
+        if self.transcode_format == 'OPUS':
+            row.prop(self, "opus_bitrate_kbps")
+
+        box = layout.box()
+        box.label(text="Silence & Stall Detection:", icon='MUTE_IPO_ON')
+        row = box.row(align=True)
+        row.prop(self, "silence_rms_threshold_db")
+        row.prop(self, "silence_peak_threshold_db")
+        row = box.row(align=True)
+        row.prop(self, "silence_timeout_seconds")
+        row.prop(self, "stall_timeout_seconds")
+        box.prop(self, "trim_trailing_silence")
\ No newline at end of file
@@ -24,6 +24,17 @@ class COMPOSER4U_AudioHistoryItem(bpy.types.PropertyGroup):
         description="Text of the history entry (prompt or response)",
         default=""
     )
+    prompt: bpy.props.StringProperty(
+        name="Prompt",
+        description="Prompt used to generate the audio of this entry",
+        default=""
+    )
+    audio_path: bpy.props.StringProperty(
+        name="Audio Path",
+        description="Path to the audio file produced by this entry",
+        subtype='FILE_PATH',
+        default=""
+    )
 
 # --- UI List for History Display ---
 class COMPOSER4U_UL_History(bpy.types.UIList):
@@ -58,10 +69,70 @@ def register_scene_properties_only_props():
         subtype='DIR_PATH', # This will give a folder picker in the UI
         default=""
     )
+    bpy.types.Scene.composer4u_extend_seconds = bpy.props.FloatProperty(
+        name="Extend By",
+        description="Number of seconds to append when extending an existing track",
+        default=10.0,
+        min=1.0,
+        soft_max=120.0
+    )
+    bpy.types.Scene.composer4u_transcode_saved_mb = bpy.props.FloatProperty(
+        name="Storage Saved (MB)",
+        description="Disk space saved in this project by archiving takes to FLAC/Opus",
+        default=0.0,
+        min=0.0
+    )
+    # Auto-ducking settings
+    bpy.types.Scene.composer4u_duck_channels = bpy.props.StringProperty(
+        name="Dialogue Channels",
+        description="Comma-separated VSE channels holding the dialogue strips to duck under, e.g. 2,3",
+        default="2"
+    )
+    bpy.types.Scene.composer4u_duck_threshold_db = bpy.props.FloatProperty(
+        name="Threshold (dB)",
+        description="Dialogue level above which the music is ducked",
+        default=-40.0,
+        max=0.0,
+        soft_min=-80.0
+    )
+    bpy.types.Scene.composer4u_duck_amount_db = bpy.props.FloatProperty(
+        name="Duck (dB)",
+        description="Gain applied to the music while dialogue is present",
+        default=-12.0,
+        max=0.0,
+        soft_min=-60.0
+    )
+    bpy.types.Scene.composer4u_duck_attack = bpy.props.FloatProperty(
+        name="Attack (s)",
+        description="Time for the music to duck when dialogue starts",
+        default=0.05,
+        min=0.0,
+        soft_max=2.0
+    )
+    bpy.types.Scene.composer4u_duck_release = bpy.props.FloatProperty(
+        name="Release (s)",
+        description="Time for the music to recover after dialogue stops",
+        default=0.5,
+        min=0.0,
+        soft_max=5.0
+    )
+    bpy.types.Scene.composer4u_duck_render = bpy.props.BoolProperty(
+        name="Render Pre-Mixed WAV",
+        description="Write a ducked copy of the music file and relink the strip to it instead of keyframing its volume",
+        default=False
+    )
 
 
 def unregister_scene_properties_only_props():
     # Unregister in reverse order of how they were linked
+    del bpy.types.Scene.composer4u_duck_render
+    del bpy.types.Scene.composer4u_duck_release
+    del bpy.types.Scene.composer4u_duck_attack
+    del bpy.types.Scene.composer4u_duck_amount_db
+    del bpy.types.Scene.composer4u_duck_threshold_db
+    del bpy.types.Scene.composer4u_duck_channels
+    del bpy.types.Scene.composer4u_transcode_saved_mb
+    del bpy.types.Scene.composer4u_extend_seconds
     del bpy.types.Scene.composer4u_output_folder # NEW: Unregister the new property
     del bpy.types.Scene.composer4u_last_audio_path
     del bpy.types.Scene.composer4u_index